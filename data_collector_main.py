@@ -1,11 +1,17 @@
 import serial
 from datetime import datetime, timedelta
 from time import sleep
+import argparse
+import logging
+import json
+import math
+import signal
 import csv
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.logger_tool import setup_logger
+from sample_bus import SampleBusWriter
 
 LOG = setup_logger('data_collector')
 
@@ -14,10 +20,37 @@ DATA_FOLDER = os.path.join(os.getcwd(), "init_tests/ODR_check/new_25")
 # CSV_HEADER = ['index', 'acc_x', 'acc_y', 'acc_z', 'gyro_x', 'gyro_y', 'gyro_z', 'mag_x', 'mag_y', 'mag_z', 'tag', 'datetime', 'activity']
 # CSV_HEADER = ['index', 'acc_x', 'acc_y', 'acc_z', 'gyro_x', 'gyro_y', 'gyro_z', 'mag_x', 'mag_y', 'mag_z', 'datetime', 'activity']
 CSV_HEADER = ['index', 'acc_x', 'acc_y', 'acc_z', 'gyro_x', 'gyro_y', 'gyro_z', 'datetime']
+LABEL_COLUMN = 'activity'
+
+# Channels published on the sample bus: epoch timestamp followed by the numeric fields
+BUS_CHANNELS = ['timestamp'] + CSV_HEADER[:-1]
 
 DEFAULT_LABEL = 'farm_ft'
 DATA_COLLECTION_INTERVAL = timedelta(minutes=5)
 
+# Delimiter used for each supported output format
+OUTPUT_FORMATS = {'csv': ',', 'tsv': '\t'}
+
+DEFAULT_CONFIG = {
+    'ports': ['/dev/ttyUSB0', '/dev/ttyUSB1'],
+    'baudrate': 19200,
+    'mode': None,                   # 'live', 'interval' or None for the interactive menu
+    'label': None,
+    'output_format': 'csv',
+    'data_folder': DATA_FOLDER,
+    'rotate_minutes': None,         # None: every DATA_COLLECTION_INTERVAL in interval mode, one file per live session. 0 disables
+    'rotate_rows': 0,               # 0 disables size based rotation
+    'sample_bus': True,
+}
+
+# Longest wait between attempts to reopen a lost serial port, in seconds
+RECONNECT_MAX_BACKOFF = 60
+
+# Set by the SIGTERM handler, checked by the collection loop
+STOP_REQUESTED = False
+# Whether a collection session is running, so SIGTERM can end it after flushing
+IN_SESSION = False
+
 def serial_init(ports, baudrate=115200, timeout=0.1) -> serial.Serial:
 
     for port in ports:
@@ -37,121 +70,353 @@ def serial_init(ports, baudrate=115200, timeout=0.1) -> serial.Serial:
 
         except (serial.SerialException, FileNotFoundError) as se:
             LOG.info(f"Failed to connect to {port}: {se}")
-        
+
     raise Exception("All specified ports failed to connect.")
 
+def serial_reconnect(ser_port: serial.Serial, ports) -> bool:
+    """
+    Reopens `ser_port` on the first of `ports` that connects, keeping its
+    settings. Retries with exponential backoff until it succeeds or SIGTERM
+    is received, in which case it returns False.
+    """
+
+    backoff = 1
+
+    while not STOP_REQUESTED:
+
+        ser_port.close()
+
+        for port in ports:
+
+            try:
+                ser_port.port = port
+                ser_port.open()
+
+                LOG.info(f"Reconnected to {port}")
+                return True
+
+            except (serial.SerialException, FileNotFoundError) as se:
+                LOG.debug(f"Failed to reconnect to {port}: {se}")
+
+        LOG.info(f"No serial port available, retrying in {backoff}s")
+
+        # Sleep in short steps so SIGTERM is not held up by the backoff
+        for _ in range(backoff):
+            if STOP_REQUESTED:
+                break
+            sleep(1)
+
+        backoff = min(backoff * 2, RECONNECT_MAX_BACKOFF)
+
+    return False
+
 def get_current_dt(str_flag=False):
     return datetime.now().strftime(TIME_STRING_FORMAT) if str_flag else datetime.now()
 
-def gen_file_path(act: str) -> str:
-    os.makedirs(DATA_FOLDER, exist_ok=True)
-    return f"{DATA_FOLDER}/{act}_{get_current_dt(str_flag=True)}.csv"
+def gen_file_path(act: str, data_folder: str = DATA_FOLDER, output_format: str = 'csv') -> str:
+    os.makedirs(data_folder, exist_ok=True)
+    return f"{data_folder}/{act}_{get_current_dt(str_flag=True)}.{output_format}"
 
-def write_to_csv(file_path, data):
+def write_to_file(file_path, data, header=CSV_HEADER, output_format='csv'):
 
     if len(data) == 0:
-        LOG.warning("Data is empty. Skipping writing to csv.")
+        LOG.warning(f"Data is empty. Skipping writing to {output_format}.")
         return
 
     with open(file_path, "a+", newline="") as current_file:
 
-        csv_writer = csv.writer(current_file)
+        csv_writer = csv.writer(current_file, delimiter=OUTPUT_FORMATS[output_format])
 
         if os.stat(file_path).st_size == 0:
-            csv_writer.writerow(CSV_HEADER)
+            csv_writer.writerow(header)
 
         csv_writer.writerows(data)
 
-def data_collector(ser_port: serial.Serial, label: str = None):
+def publish_sample(bus: SampleBusWriter, fields, now: datetime):
+    """Publishes one parsed line on the sample bus so readers never touch the serial port."""
+
+    if len(fields) != len(BUS_CHANNELS) - 1:
+        return
+
+    try:
+        bus.publish([now.timestamp(), *map(float, fields)])
+
+    except ValueError as ve:
+        LOG.error(f"Could not publish sample {fields}: {ve}")
+
+def handle_sigterm(signum, frame):
+    global STOP_REQUESTED
+    STOP_REQUESTED = True
+
+    if IN_SESSION:
+        LOG.info("SIGTERM received, stopping after the current read")
+        return
+
+    # Nothing to flush, e.g. waiting at the menu prompt, so leave right away
+    LOG.info("SIGTERM received, exiting")
+    raise SystemExit(0)
+
+def data_collector(ser_port: serial.Serial, label: str = None, bus: SampleBusWriter = None, data_folder: str = DATA_FOLDER,
+                   output_format: str = 'csv', rotate_interval: timedelta = None, rotate_rows: int = 0, ports=None,
+                   idle_log_level: int = logging.ERROR):
 
     """
-    Collects data from the serial port and writes it to a CSV file.
+    Collects data from the serial port and writes it to output files. Returns when
+    the session is interrupted (Ctrl-C) or SIGTERM is received, after flushing
+    whatever is still buffered.
 
     Args:
         ser_port (serial.Serial): The serial port to read data from.
         label (str, optional): An label to append to the data during live data collection.
+        bus (SampleBusWriter, optional): Sample bus to publish parsed samples to for live readers.
+        data_folder (str, optional): Folder the output files are written to.
+        output_format (str, optional): One of OUTPUT_FORMATS.
+        rotate_interval (timedelta, optional): Start a new file after this much time. None disables it.
+        rotate_rows (int, optional): Start a new file after this many rows. 0 disables it.
+        ports (list, optional): Ports to try when the serial connection is lost. Defaults to the current port.
+        idle_log_level (int, optional): Log level of the message logged on every read timeout.
 
     """
-    
+
+    global IN_SESSION
+
     data_buffer = []
     start_time = get_current_dt()
+    ports = ports or [ser_port.port]
+    header = CSV_HEADER + [LABEL_COLUMN] if label else CSV_HEADER
 
-    while True:
-        try:
-            s_data = ser_port.readline()
-            
-            if s_data:
-                print(f's_data = {s_data}')
-                utf_data = s_data.decode("utf-8").strip().strip('\x00').strip('**')
-
-                data_list = utf_data.split(",")  # Separate data using comma
-                data_list.append(get_current_dt(str_flag=True))  # Append timestamp
-                data_list.append(label)
-
-                if len(data_list) == len(CSV_HEADER):
-                    data_buffer.append(data_list)
-                    
-                else:
-                    LOG.error(f"Length Mismatch. DATA Received - {len(data_list)}, Data Length specified -  {len(CSV_HEADER)}\nDATA Received - {data_list}\n\n")
+    def flush():
+        file_path = gen_file_path(label if label else DEFAULT_LABEL, data_folder, output_format)
+
+        write_to_file(file_path, data_buffer, header, output_format)
+
+        if os.path.exists(file_path):
+            LOG.info(f'File generation complete -> : {file_path}')
+
+        data_buffer.clear()  # Clear the buffer after writing
+
+    IN_SESSION = True
+
+    try:
+        while not STOP_REQUESTED:
+            try:
+                s_data = ser_port.readline()
+
+                if s_data:
+                    LOG.debug(f's_data = {s_data}')
+                    utf_data = s_data.decode("utf-8").strip().strip('\x00').strip('**')
+
+                    data_list = utf_data.split(",")  # Separate data using comma
+                    now = get_current_dt()
+
+                    if bus is not None:
+                        publish_sample(bus, data_list, now)
+
+                    data_list.append(now.strftime(TIME_STRING_FORMAT))  # Append timestamp
+
+                    if label:
+                        data_list.append(label)
+
+                    if len(data_list) == len(header):
+                        data_buffer.append(data_list)
+
+                    else:
+                        LOG.error(f"Length Mismatch. DATA Received - {len(data_list)}, Data Length specified -  {len(header)}\nDATA Received - {data_list}\n\n")
+
+                    rotate_due = rotate_interval is not None and get_current_dt() - start_time >= rotate_interval
+                    full = rotate_rows and len(data_buffer) >= rotate_rows
 
-                if label is None and (get_current_dt() - start_time >= DATA_COLLECTION_INTERVAL):
+                    if rotate_due or full:
 
                         start_time = get_current_dt()
-                        file_path = gen_file_path(DEFAULT_LABEL)
+                        flush()
 
-                        write_to_csv(file_path, data_buffer)  # Write to CSV
+                else:
+                    LOG.log(idle_log_level, 'No s_data recieved')
 
-                        LOG.info(f'File generation complete -> : {file_path}')
-                        data_buffer.clear()  # Clear the buffer after writing
-            
-            else:
-                LOG.error('No s_data recieved')
+            except serial.SerialException as se:
+                LOG.error(f"Serial connection lost: {se}")
 
-        except KeyboardInterrupt:
-            
-            file_path = gen_file_path(label if label else DEFAULT_LABEL) 
+                if not serial_reconnect(ser_port, ports):
+                    break
 
-            write_to_csv(file_path, data_buffer)  # Write to CSV
+            except Exception as e:
+                LOG.error(f"Error {e}")
 
-            if os.path.exists(file_path):
-                LOG.info(f'File generation complete -> : {file_path}')
+    except KeyboardInterrupt:
+        pass
 
-            print('Activity Ended')
-            sleep(1)
+    finally:
+        flush()
+        LOG.info('Activity Ended')
+        IN_SESSION = False
+
+def load_config(argv=None) -> dict:
+    """Builds the collector config from the defaults, an optional JSON config file and the command line, in that order."""
+
+    parser = argparse.ArgumentParser(description='Collects sensor data from the serial port.')
+    parser.add_argument('-c', '--config', help='JSON file with any of the options below')
+    parser.add_argument('--ports', nargs='+', help='Serial ports to try, in order')
+    parser.add_argument('--baudrate', type=int)
+    parser.add_argument('--mode', choices=['live', 'interval'], help='Run headless in this mode instead of showing the menu')
+    parser.add_argument('--label', help='Activity label, required for live mode')
+    parser.add_argument('--output-format', choices=list(OUTPUT_FORMATS))
+    parser.add_argument('--data-folder')
+    parser.add_argument('--rotate-minutes', type=float, help='Start a new file after this many minutes, 0 to disable. '
+                        f'Defaults to {DATA_COLLECTION_INTERVAL} in interval mode and one file per live session')
+    parser.add_argument('--rotate-rows', type=int, help='Start a new file after this many rows, 0 to disable')
+    parser.add_argument('--no-sample-bus', dest='sample_bus', action='store_false', default=None, help='Do not publish samples for live readers')
+
+    args = vars(parser.parse_args(argv))
+    config = dict(DEFAULT_CONFIG)
+
+    config_file = args.pop('config')
+
+    if config_file:
+        with open(config_file) as cf:
+            file_config = json.load(cf)
+
+        unknown = set(file_config) - set(DEFAULT_CONFIG)
+
+        if unknown:
+            parser.error(f"Unknown keys in {config_file}: {', '.join(sorted(unknown))}")
+
+        config.update(file_config)
+
+    config.update({key: value for key, value in args.items() if value is not None})
 
-            main()
-        
-        except Exception as e:
-            LOG.error(f"Error {e}")
+    if config['mode'] not in (None, 'live', 'interval'):
+        parser.error(f"Unsupported mode {config['mode']}")
 
+    if config['output_format'] not in OUTPUT_FORMATS:
+        parser.error(f"Unsupported output format {config['output_format']}")
 
-ports_to_try = ['/dev/ttyUSB0', '/dev/ttyUSB1']
-hw_serial = serial_init(ports_to_try, baudrate=19200)
+    # JSON values bypass argparse's type conversion, so check them here
+    ports = config['ports']
 
-def main():
+    if not isinstance(ports, list) or not ports or not all(isinstance(port, str) for port in ports):
+        parser.error("ports must be a non-empty list of port names")
 
-    os.system('clear')
+    def is_int(value):
+        return isinstance(value, int) and not isinstance(value, bool)
 
-    print('\nData Collector')
-    print('\t1. Live')
-    print('\t2. Time Interval')
-    print('\t3. Exit')
+    if not is_int(config['baudrate']) or config['baudrate'] <= 0:
+        parser.error(f"baudrate must be a positive integer, got {config['baudrate']!r}")
 
-    ch = int(input('Enter your choice: ').strip())
+    rotate_minutes = config['rotate_minutes']
 
-    if ch == 1:
-        ip = input("ENTER ACTIVITY: ").split(':')[-1]
-        data_collector(ser_port=hw_serial, label=ip)
+    if rotate_minutes is not None and (not (is_int(rotate_minutes) or isinstance(rotate_minutes, float))
+                                       or not math.isfinite(rotate_minutes) or rotate_minutes < 0):
+        parser.error(f"rotate_minutes must be a non-negative finite number, got {rotate_minutes!r}")
 
-    elif ch == 2:
-        data_collector(ser_port=hw_serial)
+    # None leaves the choice to the session mode, see run_session
+    config['rotate_interval'] = None
 
-    elif ch == 3:
-        print("\nExiting...")
-        sys.exit(0)
+    if rotate_minutes is not None:
+        try:
+            config['rotate_interval'] = timedelta(minutes=rotate_minutes)
+
+        except OverflowError:
+            parser.error(f"rotate_minutes is too large, got {rotate_minutes!r}")
+
+    if not is_int(config['rotate_rows']) or config['rotate_rows'] < 0:
+        parser.error(f"rotate_rows must be a non-negative integer, got {config['rotate_rows']!r}")
+
+    for key in ('label', 'data_folder'):
+        if config[key] is not None and not isinstance(config[key], str):
+            parser.error(f"{key} must be a string, got {config[key]!r}")
+
+    if not isinstance(config['sample_bus'], bool):
+        parser.error(f"sample_bus must be true or false, got {config['sample_bus']!r}")
+
+    if config['mode'] == 'live' and not config['label']:
+        parser.error("Live mode needs a label")
+
+    return config
+
+def run_session(config: dict, ser_port: serial.Serial, label: str = None, bus: SampleBusWriter = None):
+
+    if config['rotate_minutes'] is None:
+        # Interval sessions rotate on DATA_COLLECTION_INTERVAL, live sessions go into one file per activity
+        rotate_interval = DATA_COLLECTION_INTERVAL if label is None else None
 
     else:
-        print('Invalid Choice')
+        # A zero interval disables time based rotation
+        rotate_interval = config['rotate_interval'] or None
+
+    data_collector(
+        ser_port=ser_port,
+        label=label,
+        bus=bus,
+        data_folder=config['data_folder'],
+        output_format=config['output_format'],
+        rotate_interval=rotate_interval,
+        rotate_rows=config['rotate_rows'],
+        ports=config['ports'],
+        # Unattended runs should not fill the journal while the sensor is idle
+        idle_log_level=logging.ERROR if config['mode'] is None else logging.DEBUG,
+    )
+
+def menu(config: dict, ser_port: serial.Serial, bus: SampleBusWriter = None):
+
+    while not STOP_REQUESTED:
+
+        os.system('clear')
+
+        print('\nData Collector')
+        print('\t1. Live')
+        print('\t2. Time Interval')
+        print('\t3. Exit')
+
+        try:
+            ch = int(input('Enter your choice: ').strip())
+
+        except ValueError:
+            ch = None
+
+        if ch == 1:
+            ip = input("ENTER ACTIVITY: ").split(':')[-1]
+            run_session(config, ser_port, label=ip, bus=bus)
+            sleep(1)
+
+        elif ch == 2:
+            run_session(config, ser_port, bus=bus)
+            sleep(1)
+
+        elif ch == 3:
+            print("\nExiting...")
+            return
+
+        else:
+            print('Invalid Choice')
+            sleep(1)
+
+def main(argv=None):
+
+    config = load_config(argv)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    hw_serial = serial_init(config['ports'], baudrate=config['baudrate'])
+    sample_bus = None
+
+    try:
+        if config['sample_bus']:
+            sample_bus = SampleBusWriter(n_channels=len(BUS_CHANNELS))
+
+        if config['mode'] is None:
+            menu(config, hw_serial, bus=sample_bus)
+
+        else:
+            label = config['label'] if config['mode'] == 'live' else None
+            LOG.info(f"Starting headless {config['mode']} collection")
+            run_session(config, hw_serial, label=label, bus=sample_bus)
+
+    finally:
+        hw_serial.close()
+
+        if sample_bus is not None:
+            sample_bus.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -4,49 +4,40 @@ matplotlib.use('TkAgg')  # Use an interactive backend
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from utils.logger_tool import setup_logger
+from sample_bus import SampleBusReader
 
-import numpy as np
-from datetime import datetime
-import serial
 import sys
 
 LOG = setup_logger('data_visualiser')
 
 
-def serial_init(ports, baudrate=115200, timeout=0.1) -> serial.Serial:
+# Samples come off the collector's shared-memory bus instead of the serial port,
+# so the visualiser can run while data_collector_main.py is recording.
+# Bus row layout: timestamp, index, acc_xyz, gyro_xyz[, mag_xyz]
+FIRST_SENSOR_CHANNEL = 2
 
-    for port in ports:
+try:
+    bus = SampleBusReader()
 
-        try:
-            hw_serial = serial.Serial(
-                port=port,
-                baudrate=baudrate,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=timeout,
-            )
+except (FileNotFoundError, ValueError) as e:
+    LOG.error(f"Sample bus not available ({e}), start data_collector_main.py first")
+    sys.exit(1)
 
-            LOG.info(f"Successfully connected to {port}")
-            return hw_serial
+overrun = 0
+waiting = False  # Collector has gone away and a restart is awaited
+mismatched_generation = None  # Restarted collector whose channel layout does not fit the plot
 
-        except (serial.SerialException, FileNotFoundError) as se:
-            LOG.info(f"Failed to connect to {port}: {se}")
-        
+axes = ['x', 'y', 'z']
+# sensors = ['acc', 'gyro']
+sensors = ['acc', 'gyro', 'mag'][:(bus.n_channels - FIRST_SENSOR_CHANNEL) // len(axes)]
 
 # Create figure for plotting
-fig, axs = plt.subplots(3, 3, figsize=(15, 10))
+fig, axs = plt.subplots(len(sensors), 3, figsize=(15, 10), squeeze=False)
 
 lines = []
 
-# Circular buffer for acc_x
+# Number of most recent samples shown
 buffer_size = 25
-data_buffer = np.zeros((buffer_size, 9), dtype=float)  # Preallocate buffer
-index = 0  # Current index in the circular buffer
-
-axes = ['x', 'y', 'z']
-# sensors = ['acc', 'gyro']
-sensors = ['acc', 'gyro', 'mag']
 
 for i, sensor in enumerate(sensors):
     for j, axis in enumerate(axes):
@@ -64,41 +55,53 @@ for i, sensor in enumerate(sensors):
         line, = ax.plot([], [], lw=1)
         lines.append(line)
 
+def reattach():
+    """Swaps to the segment of a restarted collector, if there is one yet."""
+    global bus, overrun, waiting, mismatched_generation
+
+    try:
+        new_bus = SampleBusReader()
+
+    except (FileNotFoundError, ValueError):
+        # Not created yet, or still being set up by the new collector
+        return
+
+    if new_bus.generation in (bus.generation, mismatched_generation):
+        new_bus.close()
+        return
+
+    if new_bus.n_channels != bus.n_channels:
+        mismatched_generation = new_bus.generation
+        LOG.error(f"Restarted collector publishes {new_bus.n_channels} channels instead of {bus.n_channels}, restart the visualiser")
+        new_bus.close()
+        return
+
+    bus.close()
+    bus, overrun, waiting = new_bus, 0, False
+    LOG.info("Reattached to the restarted collector")
+
 def update(frame):
-    global index, data_buffer, buffer_size
+    global overrun, waiting
     try:
-        s_data = hw_serial.readline()
-        
-        if s_data:
-            utf_data = s_data.decode("utf-8").strip().strip('\x00').strip('**')
-            data = utf_data.split(",")
-
-            if len(data) != 10:
-                raise ValueError(f'Invalid data length - {data} - {len(data)}')
-            
-            print(data)
-
-            # Update data buffers
-            data_buffer[index, 0] = (float(data[1]))      # acc_x
-            data_buffer[index, 1] = (float(data[2]))      # acc_y
-            data_buffer[index, 2] = (float(data[3]))      # acc_z
-            data_buffer[index, 3] = (float(data[4]))      # gyro_x
-            data_buffer[index, 4] = (float(data[5]))      # gyro_y
-            data_buffer[index, 5] = (float(data[6]))      # gyro_z
-            data_buffer[index, 6] = (float(data[7]))      # mag_x
-            data_buffer[index, 7] = (float(data[8]))      # mag_y
-            data_buffer[index, 8] = (float(data[9]))      # mag_z
-
-            # Update data buffer in a circular manner
-            index = (index + 1) % buffer_size  # Wrap around
-
-            current_time = datetime.now()
-            
-            for i, line in enumerate(lines):
-                line.set_data(range(buffer_size), data_buffer[:, i])
+        _, new_head, new_tail = bus.poll()
+
+        if bus.overrun != overrun:
+            LOG.warning(f"Visualiser overrun, skipped {bus.overrun - overrun} samples")
+            overrun = bus.overrun
 
-        else:
-            LOG.error('No s_data')
+        if not (len(new_head) or len(new_tail)) and bus.is_stale():
+            if not waiting:
+                LOG.warning("Collector stopped publishing, waiting for it to restart")
+                waiting = True
+
+            del new_head, new_tail  # The old segment can only be closed once no views point into it
+            reattach()
+
+        elif len(new_head) or len(new_tail):
+            data_buffer = bus.latest(buffer_size)[:, FIRST_SENSOR_CHANNEL:]
+
+            for i, line in enumerate(lines):
+                line.set_data(range(len(data_buffer)), data_buffer[:, i])
 
     except Exception as e:
         LOG.error(f"Error: {e}")
@@ -112,10 +115,7 @@ def frame_gen():
         yield 0
 
 try:
-    
-    ports_to_try = ['/dev/ttyUSB0', '/dev/ttyUSB1']
-    hw_serial = serial_init(ports_to_try, baudrate=19200)
-    
+
     # Create an animation
     ani = animation.FuncAnimation(fig, update, frames=frame_gen, blit=True, interval=5, save_count=50)
 
@@ -132,6 +132,6 @@ except Exception as e:
     LOG.error("Error:", e)
 
 finally:
-    hw_serial.close()  # Ensure the serial port is closed
+    bus.close()  # Detach from the sample bus
     plt.close()
     sys.exit(0)  # Exit the program
\ No newline at end of file
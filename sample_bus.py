@@ -0,0 +1,341 @@
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import time
+import os, sys
+
+# Shared-memory ring buffer that lets one writer (the data collector) publish
+# parsed samples to any number of readers (visualiser, live classifier, ...)
+# without them touching the serial port.
+#
+# Layout of the segment:
+#   header : int64[6]  -> [seq, capacity, n_channels, version, writer_pid, generation]
+#   ring   : float64[capacity, n_channels]
+#
+# `seq` is the total number of samples ever published. Sample `n` lives in
+# row `n % capacity`. The writer fills the row first and bumps `seq` after,
+# so a reader never sees a sequence number for a row that is not written yet.
+# While the writer is filling the row of sample `seq`, the row of sample
+# `seq - capacity` is being overwritten, so only the last `capacity - 1`
+# samples are ever safe to read.
+#
+# `writer_pid` is cleared when the writer closes, and `generation` is unique
+# per writer, so readers can tell when the collector has gone away or been
+# restarted.
+#
+# A new segment starts zero-filled. The writer sets `writer_pid` before
+# anything else and `version` last, so a segment whose version is still 0 is
+# being set up by `writer_pid`, and one with the current version is complete.
+
+SAMPLE_BUS_NAME = 'bw_sample_bus'
+SAMPLE_BUS_CAPACITY = 4096
+SAMPLE_BUS_VERSION = 2
+
+HEADER_LEN = 6
+SEQ, CAPACITY, N_CHANNELS, VERSION, WRITER_PID, GENERATION = range(HEADER_LEN)
+HEADER_BYTES = HEADER_LEN * np.dtype(np.int64).itemsize
+
+
+def _segment_size(capacity, n_channels):
+    return HEADER_BYTES + capacity * n_channels * np.dtype(np.float64).itemsize
+
+
+def _pid_alive(pid) -> bool:
+
+    if pid <= 0:
+        return False
+
+    try:
+        os.kill(pid, 0)
+
+    except ProcessLookupError:
+        return False
+
+    except PermissionError:
+        # Alive, just owned by another user
+        return True
+
+    return True
+
+
+def _shares_tracker(pid) -> bool:
+    """
+    Whether `pid` uses the same resource tracker as this process. Only this
+    process and its parent are recognised, which covers readers living in the
+    collector itself or in a direct multiprocessing child. Deeper process
+    trees are treated as unrelated.
+    """
+
+    return pid in (os.getpid(), os.getppid())
+
+
+def _read_header(shm):
+    """Returns a copy of the header as it is, whatever its version, or None if the segment is too small to hold one."""
+
+    if shm.size < HEADER_BYTES:
+        return None
+
+    return np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf).copy()
+
+
+def _attach_untracked(name):
+    """
+    Attaches to an existing segment without registering it with the resource
+    tracker, otherwise a reader exiting would unlink the writer's segment.
+
+    Before Python 3.13 attaching always registers, so the registration is
+    dropped again, unless the writer shares this process's tracker, in which
+    case it would also drop the writer's own registration.
+    """
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    shm = shared_memory.SharedMemory(name=name)
+    header = _read_header(shm)
+
+    if header is None or not _shares_tracker(int(header[WRITER_PID])):
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+    return shm
+
+
+class SampleBusWriter:
+
+    """
+    Single producer side of the sample bus. Owns the shared memory segment and
+    unlinks it on close. A segment left behind by a writer that died is
+    reclaimed; if its writer is still running a RuntimeError is raised.
+
+    Args:
+        n_channels (int): Number of float values per sample.
+        name (str, optional): Name of the shared memory segment.
+        capacity (int, optional): Number of samples kept in the ring.
+    """
+
+    def __init__(self, n_channels: int, name: str = SAMPLE_BUS_NAME, capacity: int = SAMPLE_BUS_CAPACITY):
+
+        size = _segment_size(capacity, n_channels)
+
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        except FileExistsError:
+            self._reclaim(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        self.header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=self.shm.buf)
+        self.ring = np.ndarray((capacity, n_channels), dtype=np.float64, buffer=self.shm.buf, offset=HEADER_BYTES)
+
+        self.name = name
+        self.pid = os.getpid()
+        self.generation = time.time_ns()
+
+        # Claim the segment first and mark it complete last, see the layout notes above
+        self.header[WRITER_PID] = self.pid
+        self.header[GENERATION] = self.generation
+        self.header[CAPACITY] = capacity
+        self.header[N_CHANNELS] = n_channels
+        self.header[SEQ] = 0
+
+        self.ring.fill(np.nan)
+        self.header[VERSION] = SAMPLE_BUS_VERSION
+
+        self.capacity = capacity
+        self.n_channels = n_channels
+        self._seq = 0
+
+    @staticmethod
+    def _reclaim(name):
+        """
+        Unlinks an existing segment called `name` if its writer is known to be
+        dead (or closed it), raises RuntimeError otherwise.
+        """
+
+        existing = shared_memory.SharedMemory(name=name)
+        header = _read_header(existing)
+        existing.close()
+
+        version = int(header[VERSION]) if header is not None else None
+        owner = int(header[WRITER_PID]) if header is not None else 0
+
+        if version == SAMPLE_BUS_VERSION and owner == 0:
+            reason = None  # Closed by its writer
+
+        elif version not in (0, SAMPLE_BUS_VERSION):
+            reason = f"has an unknown layout (version {version}), remove /dev/shm/{name} if no collector is running"
+
+        elif owner == 0:
+            reason = f"has no owner recorded yet, remove /dev/shm/{name} if no collector is running"
+
+        elif _pid_alive(owner):
+            reason = f"is in use by running process {owner}"
+
+        else:
+            reason = None  # Left behind by a collector that did not shut down cleanly
+
+        if reason is not None:
+            # Drop the registration made by attaching, unless it is the owner's own
+            if not _shares_tracker(owner):
+                resource_tracker.unregister(existing._name, 'shared_memory')
+
+            raise RuntimeError(f"Sample bus '{name}' {reason}")
+
+        existing.unlink()
+
+    def publish(self, sample):
+        """Writes one sample into the ring and advances the sequence counter."""
+
+        self.ring[self._seq % self.capacity] = sample
+        self._seq += 1
+        self.header[SEQ] = self._seq
+
+    def close(self):
+        # Tell readers the writer is gone, then drop the numpy views before releasing the buffer
+        self.header[WRITER_PID] = 0
+        del self.header, self.ring
+        self.shm.close()
+
+        # Only unlink the name if it still refers to this writer's segment
+        try:
+            current = shared_memory.SharedMemory(name=self.name)
+
+        except FileNotFoundError:
+            return
+
+        header = _read_header(current)
+        current.close()
+
+        if header is not None and header[VERSION] == SAMPLE_BUS_VERSION and header[GENERATION] == self.generation:
+            self.shm.unlink()
+
+        elif header is None or not _shares_tracker(int(header[WRITER_PID])):
+            # Someone else owns the name now; drop the registration so the tracker does not unlink it
+            resource_tracker.unregister(current._name, 'shared_memory')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SampleBusReader:
+
+    """
+    Read-only consumer side of the sample bus. Any number of readers can attach
+    and none of them can slow the writer down; a reader that falls more than
+    `capacity - 1` samples behind is told so through the `overrun` count, and
+    `still_valid()` tells whether rows handed out by `poll()` were overwritten
+    while they were being consumed.
+
+    The reader stays on the segment it attached to. Once `is_stale()` is True
+    the collector has exited or restarted, and a new reader has to be created.
+
+    Args:
+        name (str, optional): Name of the shared memory segment to attach to.
+    """
+
+    def __init__(self, name: str = SAMPLE_BUS_NAME):
+
+        self.shm = _attach_untracked(name)
+
+        if self.shm.size < HEADER_BYTES:
+            self.shm.close()
+            raise ValueError(f"Sample bus '{name}' is too small to hold a header")
+
+        header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=self.shm.buf)
+        version = int(header[VERSION])
+
+        if version != SAMPLE_BUS_VERSION:
+            # The view has to go before the buffer is unmapped
+            del header
+            self.shm.close()
+
+            if version == 0:
+                raise ValueError(f"Sample bus '{name}' is still being set up")
+
+            raise ValueError(f"Unsupported sample bus version {version}")
+
+        self.capacity = int(header[CAPACITY])
+        self.n_channels = int(header[N_CHANNELS])
+        self.generation = int(header[GENERATION])
+
+        self.header = header
+        self.header.flags.writeable = False
+
+        self.ring = np.ndarray((self.capacity, self.n_channels), dtype=np.float64, buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.ring.flags.writeable = False
+
+        # Start from the live edge, not from whatever is already in the ring
+        self.next_seq = self.seq
+        self.overrun = 0
+
+    @property
+    def seq(self) -> int:
+        return int(self.header[SEQ])
+
+    def still_valid(self, start_seq: int) -> bool:
+        """Whether the sample `start_seq` and everything after it is still intact in the ring."""
+
+        return self.seq - start_seq < self.capacity
+
+    def is_stale(self) -> bool:
+        """Whether the writer of the attached segment has closed or died."""
+
+        return not _pid_alive(int(self.header[WRITER_PID]))
+
+    def poll(self):
+        """
+        Returns `(start_seq, head, tail)`: the sequence number of the first new
+        sample and zero-copy views of the samples published since the last
+        poll, oldest first. `tail` is non-empty only when the new samples wrap
+        around the end of the ring. Samples that were overwritten before this
+        reader got to them are skipped and counted in `self.overrun`.
+
+        The views point into live memory. Call `still_valid(start_seq)` after
+        consuming them; if it is False the writer lapped the reader meanwhile
+        and the data read must be discarded.
+        """
+
+        end = self.seq
+        start = self.next_seq
+        window = self.capacity - 1
+
+        if end - start > window:
+            self.overrun += end - start - window
+            start = end - window
+
+        self.next_seq = end
+
+        lo, hi = start % self.capacity, end % self.capacity
+
+        if lo <= hi:
+            return start, self.ring[lo:hi], self.ring[:0]
+
+        return start, self.ring[lo:], self.ring[:hi]
+
+    def latest(self, n: int) -> np.ndarray:
+        """
+        Returns a copy of the last `n` published samples, oldest first. Rows
+        overwritten while copying are dropped, so fewer than `n` rows may come
+        back.
+        """
+
+        end = self.seq
+        n = min(n, end, self.capacity - 1)
+        start = end - n
+        rows = self.ring[np.arange(start, end) % self.capacity]
+
+        torn = self.seq - start - (self.capacity - 1)
+
+        return rows[torn:] if torn > 0 else rows
+
+    def close(self):
+        del self.header, self.ring
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()